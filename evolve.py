@@ -11,37 +11,76 @@ Features:
 - Dashboard sync endpoints: POSTs to DASHBOARD_URL
 """
 
-from flask import Flask, request, jsonify, session
-import os, sqlite3, re, random, requests, time, json
-from datetime import datetime, timedelta
+from flask import Flask, request, jsonify, session, Response, stream_with_context
+import os, sqlite3, re, hashlib, secrets, requests, time, threading, queue, atexit
+from requests.adapters import HTTPAdapter
+from datetime import datetime, timezone
+from functools import lru_cache
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
+from fastjson import use_orjson
 
 load_dotenv()
 
 app = Flask(__name__)
 app.secret_key = os.environ.get('BOT_SECRET_KEY', 'super-secret')
+use_orjson(app)
 DB_PATH = os.environ.get('BOT_DB', 'rugike_support.db')
 DASHBOARD_URL = os.environ.get('DASHBOARD_URL', 'http://127.0.0.1:5001')
 ADMIN_KEY = os.environ.get('ADMIN_KEY', 'admin-secret-key')
 OPENAI_KEY = os.getenv('OPENAI_API_KEY')
 USE_AI = bool(OPENAI_KEY)
 
+AI_MODEL = 'gpt-4o-mini'
+AI_SYSTEM_PROMPT = "You are a helpful customer support assistant for a car marketplace. Answer concisely."
+
+_OAI = None  # single client so every call reuses its HTTP connection pool
 if USE_AI:
     try:
-        import openai
-        openai.api_key = OPENAI_KEY
+        from openai import OpenAI
+        _OAI = OpenAI(api_key=OPENAI_KEY)
     except Exception:
         USE_AI = False
 
 # ---------------- DB helpers ----------------
-def get_db_connection():
+_KB_VERSION = 0  # part of the search cache key; bump via invalidate_kb_cache() on kb writes
+def invalidate_kb_cache():
+    global _KB_VERSION
+    _KB_VERSION += 1
+
+_local = threading.local()
+
+def _connect():
     conn = sqlite3.connect(DB_PATH, check_same_thread=False)
     conn.row_factory = sqlite3.Row
+    conn.execute('PRAGMA synchronous=NORMAL')
+    conn.execute('PRAGMA wal_autocheckpoint=1000')
+    conn.execute('PRAGMA busy_timeout=5000')
+    conn.execute('PRAGMA temp_store=MEMORY')
+    conn.execute('PRAGMA mmap_size=268435456')
+    conn.execute('PRAGMA cache_size=-20000')
+    return conn
+
+def get_db_connection():
+    # one long-lived connection per worker thread; callers commit but never close it
+    conn = getattr(_local, 'conn', None)
+    if conn is None:
+        conn = _local.conn = _connect()
     return conn
 
+@app.teardown_appcontext
+def release_db_connection(exc):
+    # connections stay open for reuse; just drop any transaction a failed request left behind
+    conn = getattr(_local, 'conn', None)
+    if conn is not None and conn.in_transaction:
+        conn.rollback()
+
 def init_db():
     conn = get_db_connection()
     c = conn.cursor()
+    # WAL is persistent in the db file: readers no longer block on writers
+    c.execute('PRAGMA journal_mode=WAL')
     # core tables
     c.execute('''CREATE TABLE IF NOT EXISTS messages (
                     id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -50,8 +89,20 @@ def init_db():
     c.execute('''CREATE TABLE IF NOT EXISTS users (
                     session_id TEXT PRIMARY KEY, name TEXT, email TEXT,
                     last_seen TEXT, xp INTEGER DEFAULT 0, level INTEGER DEFAULT 1,
-                    achievements TEXT DEFAULT '', mode TEXT DEFAULT 'friendly'
+                    achievements TEXT DEFAULT '', mode TEXT DEFAULT 'friendly',
+                    msg_count INTEGER DEFAULT 0, ach_mask INTEGER DEFAULT 0
                 )''')
+    # per-session message counter (added after launch, so migrate + backfill older databases)
+    user_cols = {r['name'] for r in c.execute('PRAGMA table_info(users)')}
+    if 'msg_count' not in user_cols:
+        c.execute('ALTER TABLE users ADD COLUMN msg_count INTEGER DEFAULT 0')
+        c.execute('UPDATE users SET msg_count = (SELECT COUNT(*) FROM messages WHERE messages.session_id = users.session_id)')
+    # achievements moved from comma-joined TEXT to a bitmask (see ACH_* below)
+    if 'ach_mask' not in user_cols:
+        c.execute('ALTER TABLE users ADD COLUMN ach_mask INTEGER DEFAULT 0')
+        c.execute('''UPDATE users SET ach_mask = (CASE WHEN achievements LIKE '%First Message%' THEN 1 ELSE 0 END)
+                     | (CASE WHEN achievements LIKE '%Reached Level 5%' THEN 2 ELSE 0 END)
+                     | (CASE WHEN achievements LIKE '%Reached Level 10%' THEN 4 ELSE 0 END)''')
     c.execute('''CREATE TABLE IF NOT EXISTS tickets (
                     id INTEGER PRIMARY KEY AUTOINCREMENT, session_id TEXT,
                     subject TEXT, description TEXT, status TEXT, created_at TEXT, updated_at TEXT
@@ -59,6 +110,9 @@ def init_db():
     c.execute('''CREATE TABLE IF NOT EXISTS kb (
                     id INTEGER PRIMARY KEY AUTOINCREMENT, question TEXT, answer TEXT, tags TEXT
                 )''')
+    # one row, bumped by /kb_reload so every worker process knows to rebuild its KB index
+    c.execute('CREATE TABLE IF NOT EXISTS kb_meta (id INTEGER PRIMARY KEY CHECK (id = 1), version INTEGER NOT NULL)')
+    c.execute('INSERT OR IGNORE INTO kb_meta (id, version) VALUES (1, 0)')
     # new feature tables
     c.execute('''CREATE TABLE IF NOT EXISTS summaries (
                     id INTEGER PRIMARY KEY AUTOINCREMENT, session_id TEXT,
@@ -76,11 +130,52 @@ def init_db():
                     id INTEGER PRIMARY KEY AUTOINCREMENT, session_id TEXT,
                     tag TEXT, created_at TEXT
                 )''')
+    # indexes for the per-message summary/count lookups and the leaderboard/stats queries
+    c.execute('CREATE INDEX IF NOT EXISTS idx_messages_sid_id ON messages(session_id, id DESC)')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_tickets_status ON tickets(status)')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_users_level_xp ON users(level DESC, xp DESC)')
     conn.commit()
-    conn.close()
 
 init_db()
 
+# ---------------- in-memory KB ----------------
+# the kb table is small and read-mostly: keep it in memory with a token -> rows index
+KB_STOPWORDS = frozenset({'a', 'an', 'the', 'to', 'is', 'it', 'i', 'my', 'me', 'how', 'do', 'can',
+                          'what', 'of', 'for', 'and', 'or', 'in', 'on', 'with'})
+_KB = ((), {})  # (rows [(question, answer, tags)], token -> set of row indexes), swapped as one
+KB_VERSION_CHECK = 2.0  # seconds between checks for a /kb_reload handled by another worker
+_KB_SEEN = (0.0, None)  # (next check, kb_meta.version the loaded index reflects)
+
+def kb_tokens(text):
+    return {t for t in re.findall(r'\w+', text.lower()) if t not in KB_STOPWORDS}
+
+def load_kb():
+    global _KB, _KB_SEEN
+    conn = get_db_connection(); c = conn.cursor()
+    # version first: a reload that lands mid-read is picked up again at the next check
+    version = c.execute('SELECT version FROM kb_meta WHERE id=1').fetchone()[0]
+    c.execute('SELECT question, answer, tags FROM kb ORDER BY id')
+    rows = tuple((r['question'], r['answer'], r['tags'] or '') for r in c.fetchall())
+    index = {}
+    for i, (question, answer, tags) in enumerate(rows):
+        for t in kb_tokens(f"{question} {tags}"):
+            index.setdefault(t, set()).add(i)
+    _KB = (rows, index)
+    _KB_SEEN = (time.monotonic() + KB_VERSION_CHECK, version)
+    invalidate_kb_cache()
+
+def refresh_kb_if_stale():
+    # /kb_reload only runs in the worker that got the request; the others notice the
+    # bumped kb_meta.version here, at most KB_VERSION_CHECK seconds later
+    global _KB_SEEN
+    if time.monotonic() < _KB_SEEN[0]:
+        return
+    version = get_db_connection().execute('SELECT version FROM kb_meta WHERE id=1').fetchone()[0]
+    if version != _KB_SEEN[1]:
+        load_kb()
+    else:
+        _KB_SEEN = (time.monotonic() + KB_VERSION_CHECK, version)
+
 # seed KB (if empty)
 def seed_kb():
     conn = get_db_connection(); c = conn.cursor()
@@ -93,52 +188,209 @@ def seed_kb():
         ]
         c.executemany('INSERT INTO kb (question,answer,tags) VALUES (?,?,?)', items)
         conn.commit()
-    conn.close()
+    load_kb()
 
 seed_kb()
 
+# ---------------- DB maintenance ----------------
+MAINTENANCE_INTERVAL = 60  # seconds between WAL checkpoint / optimize runs
+def db_maintenance_loop():
+    # dedicated connection so maintenance never contends with request connections
+    conn = sqlite3.connect(DB_PATH, check_same_thread=False)
+    while True:
+        time.sleep(MAINTENANCE_INTERVAL)
+        for pragma in ('PRAGMA wal_checkpoint(TRUNCATE)', 'PRAGMA optimize'):
+            start = time.perf_counter()
+            try:
+                conn.execute(pragma).fetchall()
+                app.logger.info("%s took %.1f ms", pragma, (time.perf_counter() - start) * 1000)
+            except sqlite3.Error as e:
+                app.logger.warning("%s failed: %s", pragma, e)
+
+def start_db_maintenance():
+    threading.Thread(target=db_maintenance_loop, name='db-maintenance', daemon=True).start()
+
+start_db_maintenance()
+
+# ---------------- dashboard sync ----------------
+# events are queued on the request path and POSTed to DASHBOARD_URL/batch by one worker
+DASHBOARD_BATCH_SIZE = 32
+DASHBOARD_BATCH_WAIT = 0.2  # seconds to wait for more events before flushing a batch
+EVENT_Q = queue.Queue(maxsize=10000)
+_http = requests.Session()
+_http.mount('http://', HTTPAdapter(pool_connections=4, pool_maxsize=8))
+_http.mount('https://', HTTPAdapter(pool_connections=4, pool_maxsize=8))
+
+def notify_dashboard(event, payload):
+    # best-effort: drop the event rather than block a request if the dashboard falls behind
+    try:
+        EVENT_Q.put_nowait({'event': event, 'payload': payload, 'time': utc_now()})
+    except queue.Full:
+        pass
+
+def take_batch(q, size, wait):
+    # block for one item, then keep collecting until `size` items or `wait` seconds
+    batch = [q.get()]
+    deadline = time.monotonic() + wait
+    while len(batch) < size:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            break
+        try:
+            batch.append(q.get(timeout=remaining))
+        except queue.Empty:
+            break
+    return batch
+
+def dashboard_sync_loop():
+    while True:
+        batch = take_batch(EVENT_Q, DASHBOARD_BATCH_SIZE, DASHBOARD_BATCH_WAIT)
+        try:
+            _http.post(f"{DASHBOARD_URL}/batch", json=batch, headers={'X-ADMIN-KEY': ADMIN_KEY}, timeout=1.5)
+        except Exception:
+            pass
+
+def start_dashboard_sync():
+    threading.Thread(target=dashboard_sync_loop, name='dashboard-sync', daemon=True).start()
+
+start_dashboard_sync()
+
 # ---------------- utils ----------------
+_TS = (0, '')  # (epoch second, ISO string) swapped atomically
+def utc_now():
+    # second-resolution UTC ISO timestamp, formatted at most once per second
+    global _TS
+    t = int(time.time())
+    if t != _TS[0]:
+        _TS = (t, datetime.fromtimestamp(t, timezone.utc).replace(tzinfo=None).isoformat())
+    return _TS[1]
+
 def get_session_id():
     sid = session.get('sid')
     if not sid:
-        sid = os.urandom(16).hex()
+        sid = secrets.token_hex(16)
         session['sid'] = sid
     return sid
 
+LAST_SEEN_WINDOW = 30  # seconds; skip last_seen-only writes inside this window
+_LAST_SEEN = OrderedDict()  # sid -> time.time() of last profile write, oldest first
+_LAST_SEEN_LOCK = threading.Lock()
+
+def mark_seen(sid):
+    # entries past the window no longer suppress a write, so drop them; keeps the map
+    # down to the sessions active in the last LAST_SEEN_WINDOW seconds
+    now = time.time()
+    with _LAST_SEEN_LOCK:
+        _LAST_SEEN[sid] = now
+        _LAST_SEEN.move_to_end(sid)
+        while _LAST_SEEN:
+            oldest, t = next(iter(_LAST_SEEN.items()))
+            if now - t < LAST_SEEN_WINDOW:
+                break
+            del _LAST_SEEN[oldest]
+
+UPSERT_USER_SQL = '''INSERT INTO users (session_id, name, email, last_seen) VALUES (?,?,?,?)
+                     ON CONFLICT(session_id) DO UPDATE SET last_seen=excluded.last_seen,
+                     name=COALESCE(excluded.name, users.name), email=COALESCE(excluded.email, users.email)'''
+
+def profile_write_needed(sid, name=None, email=None):
+    return name is not None or email is not None or time.time() - _LAST_SEEN.get(sid, 0) >= LAST_SEEN_WINDOW
+
 def save_user_profile(sid, name=None, email=None):
-    now = datetime.utcnow().isoformat()
+    if not profile_write_needed(sid, name, email):
+        return
+    now = utc_now()
     conn = get_db_connection(); c = conn.cursor()
-    c.execute('INSERT OR IGNORE INTO users (session_id, name, email, last_seen) VALUES (?,?,?,?)', (sid, name, email, now))
-    c.execute('UPDATE users SET last_seen=? WHERE session_id=?', (now, sid))
-    conn.commit(); conn.close()
+    c.execute(UPSERT_USER_SQL, (sid, name, email, now))
+    conn.commit()
+    mark_seen(sid)
+
+# ---------------- message writer ----------------
+# messages are only read later (history, summaries, stats), so request threads just
+# enqueue them; one writer thread inserts each batch with a single prepared executemany
+INSERT_MESSAGE_SQL = 'INSERT INTO messages (session_id, role, content, created_at) VALUES (?,?,?,?)'
+MSG_BATCH_SIZE = 64
+MSG_BATCH_WAIT = 0.1  # seconds to wait for more messages before committing a batch
+MSG_Q = queue.Queue()
+
+def write_messages(rows):
+    # insert rows and bump each session's msg_count in one commit; returns sessions due a summary
+    per_session = {}
+    for sid, role, content, now in rows:
+        per_session[sid] = (per_session.get(sid, (0, now))[0] + 1, now)
+    due = []
+    conn = get_db_connection()
+    # commits on success; on any error rolls back so the writer never sits on the write lock
+    # and a dropped batch can't be committed later without its msg_count bump
+    with conn:
+        conn.executemany(INSERT_MESSAGE_SQL, rows)
+        for sid, (n, now) in per_session.items():
+            row = conn.execute('UPDATE users SET msg_count = msg_count + ?, last_seen=? WHERE session_id=? RETURNING msg_count', (n, now, sid)).fetchone()
+            if row and row[0] // SUMMARY_TRIGGER > (row[0] - n) // SUMMARY_TRIGGER:
+                due.append(sid)
+    return due
+
+_MSG_STOP = object()  # queued at exit so the writer commits what it holds and returns
+
+def message_writer_loop():
+    while True:
+        batch = take_batch(MSG_Q, MSG_BATCH_SIZE, MSG_BATCH_WAIT)
+        rows = [r for r in batch if isinstance(r, tuple)]
+        try:
+            due = write_messages(rows) if rows else []
+        except sqlite3.Error as e:
+            app.logger.warning("dropped %d messages: %s", len(rows), e)
+            due = []
+        for item in batch:
+            if isinstance(item, threading.Event):
+                item.set()
+        for sid in due:
+            # summaries may call out to OpenAI; the summary worker handles them
+            SUMMARY_Q.put(sid)
+        if any(item is _MSG_STOP for item in batch):
+            return
+
+def flush_messages(timeout=1.0):
+    # for the few reads that need this worker's own just-logged messages (e.g. /favorite):
+    # returns once everything queued before the call is committed, or after `timeout`
+    done = threading.Event()
+    MSG_Q.put(done)
+    return done.wait(timeout)
+
+_MSG_WRITER = None
+def start_message_writer():
+    global _MSG_WRITER
+    _MSG_WRITER = threading.Thread(target=message_writer_loop, name='message-writer', daemon=True)
+    _MSG_WRITER.start()
+
+def stop_message_writer(timeout=5):
+    # flush queued messages on interpreter exit
+    if _MSG_WRITER is not None and _MSG_WRITER.is_alive():
+        MSG_Q.put(_MSG_STOP)
+        _MSG_WRITER.join(timeout)
+
+start_message_writer()
+atexit.register(stop_message_writer)
 
 def log_message(session_id, role, content):
-    now = datetime.utcnow().isoformat()
-    conn = get_db_connection(); c = conn.cursor()
-    c.execute('INSERT INTO messages (session_id, role, content, created_at) VALUES (?,?,?,?)', (session_id, role, content, now))
-    conn.commit(); conn.close()
-    # send to dashboard (best-effort)
-    try:
-        requests.post(f"{DASHBOARD_URL}/log_message", json={'sid': session_id, 'role': role, 'content': content, 'time': now}, timeout=1.5)
-    except Exception:
-        pass
+    now = utc_now()
+    MSG_Q.put((session_id, role, content, now))
+    notify_dashboard('log_message', {'sid': session_id, 'role': role, 'content': content, 'time': now})
 
 # ---------------- moderation ----------------
+# hot-path matching uses google-re2 (linear-time DFA) when installed; the patterns
+# below stick to syntax both engines accept, e.g. inline (?i) instead of re flags
+try:
+    import re2 as regex
+except ImportError:
+    regex = re
+
 PROHIBITED_PATTERNS = [r"\bterror\b", r"\bexplosive\b", r"\bkill\b"]
-def moderate_text(text):
-    lowered = text.lower()
-    for p in PROHIBITED_PATTERNS:
-        if re.search(p, lowered):
-            return False, "Potentially violent or illegal content detected."
-    return True, ""
+MOD_BLOCK_REASON = "Potentially violent or illegal content detected."
 
 # ---------------- analytics events ----------------
 def send_analytics(event_type, payload):
-    payload = {'event': event_type, 'payload': payload, 'time': datetime.utcnow().isoformat()}
-    try:
-        requests.post(f"{DASHBOARD_URL}/analytics_event", json=payload, timeout=1.5)
-    except Exception:
-        pass
+    notify_dashboard('analytics_event', {'event': event_type, 'payload': payload, 'time': utc_now()})
 
 # ---------------- gamification ----------------
 ACHIEVEMENTS = {
@@ -148,31 +400,36 @@ ACHIEVEMENTS = {
     'level10': "Reached Level 10"
 }
 
-def award_xp(session_id, amount=10):
-    conn = get_db_connection(); c = conn.cursor()
-    c.execute('SELECT xp, level, achievements FROM users WHERE session_id=?', (session_id,))
-    row = c.fetchone()
-    if row:
-        xp, level, achs = row['xp'], row['level'], row['achievements'] or ''
-        xp += amount
-        new_level = 1 + xp // 100
-        achievements = set([a for a in achs.split(',') if a]) if achs else set()
-        if xp > 0 and 'First Message' not in achievements:
-            achievements.add(ACHIEVEMENTS['first_msg'])
-        if new_level >=5 and ACHIEVEMENTS['level5'] not in achievements:
-            achievements.add(ACHIEVEMENTS['level5'])
-        if new_level >=10 and ACHIEVEMENTS['level10'] not in achievements:
-            achievements.add(ACHIEVEMENTS['level10'])
-        c.execute('UPDATE users SET xp=?, level=?, achievements=? WHERE session_id=?', (xp, new_level, ','.join(achievements), session_id))
-        conn.commit()
-    conn.close()
-    # notify dashboard
-    send_analytics('xp_awarded', {'sid': session_id, 'amount': amount})
-    return random.choice([
-        "Nice progress! Keep going.",
-        "Great work — XP added!",
-        "You're learning — XP awarded!"
-    ])
+# users.ach_mask bits
+ACH_FIRST, ACH_LEVEL5, ACH_LEVEL10 = 1, 2, 4
+ACH_BITS = ((ACH_FIRST, 'first_msg'), (ACH_LEVEL5, 'level5'), (ACH_LEVEL10, 'level10'))
+
+def achievement_names(mask):
+    return [ACHIEVEMENTS[key] for bit, key in ACH_BITS if mask & bit]
+
+def _apply_xp(conn, session_id, amount):
+    # xp/level/achievement update in one statement, without committing; returns (ach_mask, level) or None
+    return conn.execute('''UPDATE users SET xp = xp + :amt, level = 1 + (xp + :amt) / 100,
+                           ach_mask = ach_mask
+                               | (CASE WHEN xp + :amt > 0 THEN 1 ELSE 0 END)
+                               | (CASE WHEN 1 + (xp + :amt) / 100 >= 5 THEN 2 ELSE 0 END)
+                               | (CASE WHEN 1 + (xp + :amt) / 100 >= 10 THEN 4 ELSE 0 END)
+                           WHERE session_id = :sid RETURNING ach_mask, level''',
+                        {'amt': amount, 'sid': session_id}).fetchone()
+
+def record_user_turn(sid, name, email, content, xp=5):
+    # profile upsert + xp award committed once; the message itself goes to the writer queue
+    now = utc_now()
+    upsert = profile_write_needed(sid, name, email)
+    conn = get_db_connection()
+    if upsert:
+        conn.execute(UPSERT_USER_SQL, (sid, name, email, now))
+    _apply_xp(conn, sid, xp)
+    conn.commit()
+    if upsert:
+        mark_seen(sid)
+    log_message(sid, 'user', content)
+    send_analytics('xp_awarded', {'sid': sid, 'amount': xp})
 
 # ---------------- kb & intents ----------------
 INTENTS = {
@@ -184,24 +441,80 @@ INTENTS = {
     'report_issue': ['report', 'fraud', 'scam', 'problem with listing'],
     'help': ['help', 'support', 'customer service', '?']
 }
-def detect_intent(text):
-    text_l = text.lower()
-    for intent, patterns in INTENTS.items():
-        for p in patterns:
-            try:
-                if re.search(p, text_l):
-                    return intent
-            except re.error:
-                if p in text_l:
-                    return intent
-    return 'unknown'
-
+# moderation + intents fused into one pass over the message; prohibited patterns come first
+# so their ids / group order rank ahead of every intent; intent phrases are literal text,
+# so they are escaped (this also covers the bare '?')
+_INTENT_ORDER = list(INTENTS)
+MEGA_RE = regex.compile("(?i)" + "|".join(
+    [f"(?P<mod_{i}>{p})" for i, p in enumerate(PROHIBITED_PATTERNS)] +
+    [f"(?P<intent_{k}>{'|'.join(map(re.escape, v))})" for k, v in INTENTS.items()]
+))
+
+# optional hyperscan DFA: reports every (even overlapping) phrase hit in a single scan
+try:
+    import hyperscan
+except ImportError:
+    hyperscan = None
+
+_SCAN_LABELS = [None] * len(PROHIBITED_PATTERNS) + [intent for intent, patterns in INTENTS.items() for p in patterns]
+_SCAN_HS = None
+if hyperscan is not None:
+    try:
+        _SCAN_HS = hyperscan.Database()
+        _SCAN_HS.compile(
+            expressions=[p.encode() for p in PROHIBITED_PATTERNS] + [re.escape(p).encode() for patterns in INTENTS.values() for p in patterns],
+            ids=list(range(len(_SCAN_LABELS))),
+            flags=[hyperscan.HS_FLAG_CASELESS | hyperscan.HS_FLAG_SINGLEMATCH] * len(_SCAN_LABELS)
+        )
+    except Exception:
+        _SCAN_HS = None
+
+def scan_message(text):
+    """One scan for both checks: returns (blocked, intent) with intent 'unknown' when nothing matched."""
+    if _SCAN_HS is not None:
+        hits = []
+        _SCAN_HS.scan(text.encode(), match_event_handler=lambda id_, start, end, flags, ctx: hits.append(id_))
+        if not hits:
+            return False, 'unknown'
+        blocked = min(hits) < len(PROHIBITED_PATTERNS)
+        intents = [i for i in hits if i >= len(PROHIBITED_PATTERNS)]
+        return blocked, _SCAN_LABELS[min(intents)] if intents else 'unknown'
+    blocked, best = False, None
+    for m in MEGA_RE.finditer(text):
+        if m.lastgroup.startswith('mod_'):
+            blocked = True
+        else:
+            rank = _INTENT_ORDER.index(m.lastgroup[len('intent_'):])
+            best = rank if best is None else min(best, rank)
+    return blocked, _INTENT_ORDER[best] if best is not None else 'unknown'
+
+KB_STRONG_SCORE = 2  # query tokens a KB row must share to win over the canned intents
 def search_kb(query, limit=3):
+    # returns ((score, question, answer), ...) best first; equivalent queries share a cache slot
+    refresh_kb_if_stale()
+    return _search_kb_cached(' '.join(query.lower().split()), limit, _KB_VERSION)
+
+@lru_cache(maxsize=512)
+def _search_kb_cached(query, limit, version):
+    # score = number of distinct query tokens a row shares; ties keep kb order
+    rows, index = _KB
+    scores = {}
+    for t in kb_tokens(query):
+        for i in index.get(t, ()):
+            scores[i] = scores.get(i, 0) + 1
+    ranked = sorted(scores.items(), key=lambda h: (-h[1], h[0]))[:limit]
+    return tuple((score, rows[i][0], rows[i][1]) for i, score in ranked)
+
+def warm_caches():
+    # prime sqlite's page cache and the KB / intent paths so the first users don't pay cold-start costs
     conn = get_db_connection(); c = conn.cursor()
-    q = f"%{query.lower()}%"
-    c.execute('SELECT question,answer FROM kb WHERE LOWER(question) LIKE ? OR LOWER(tags) LIKE ? LIMIT ?', (q,q,limit))
-    rows = c.fetchall(); conn.close()
-    return [{'question': r['question'], 'answer': r['answer']} for r in rows]
+    c.execute('SELECT id FROM messages LIMIT 1').fetchall()
+    for question, answer, tags in _KB[0]:
+        search_kb(question)
+    for patterns in INTENTS.values():
+        scan_message(patterns[0])
+
+threading.Thread(target=warm_caches, name='cache-warmup', daemon=True).start()
 
 # ---------------- OpenAI helpers (optional) ----------------
 def generate_summary_from_messages(session_id, messages_text):
@@ -211,38 +524,51 @@ def generate_summary_from_messages(session_id, messages_text):
         return f"Quick summary: {snippet}..."
     try:
         prompt = f"Summarize the user support conversation concisely:\n\n{messages_text}\n\nSummary:"
-        res = openai.ChatCompletion.create(model="gpt-4o-mini", messages=[{"role":"user","content":prompt}], max_tokens=150, temperature=0.2)
+        res = _OAI.chat.completions.create(model=AI_MODEL, messages=[{"role":"user","content":prompt}], max_tokens=150, temperature=0.2)
         return res.choices[0].message.content.strip()
     except Exception:
         return "(AI summary unavailable) Quick summary generated."
 
+@lru_cache(maxsize=256)
+def _ai_answer_cached(user_message):
+    # errors propagate, so lru_cache only ever stores real answers
+    res = _OAI.chat.completions.create(model=AI_MODEL, messages=[
+        {"role":"system","content":AI_SYSTEM_PROMPT},
+        {"role":"user","content":user_message}
+    ], max_tokens=200, temperature=0.2)
+    return res.choices[0].message.content.strip()
+
 def ai_fallback_answer(user_message):
     if not USE_AI:
         return "Sorry — I couldn't find an exact answer. Type 'escalate' to open a ticket."
     try:
-        prompt = f"You are a helpful customer support assistant for a car marketplace. Answer concisely.\nUser: {user_message}\nAnswer:"
-        res = openai.ChatCompletion.create(model="gpt-4o-mini", messages=[{"role":"user","content":prompt}], max_tokens=250, temperature=0.2)
-        return res.choices[0].message.content.strip()
+        return _ai_answer_cached(user_message)
     except Exception:
         return "AI unavailable right now."
 
 # ---------------- Car listing assistant ----------------
+# precompiled once; searched separately because the fields may overlap ("2000 km" is
+# both a plausible year and a mileage), which a single alternation can't report
+CAR_RES = (
+    ('year', regex.compile(r'\b(?:19|20)\d{2}\b')),
+    ('mileage', regex.compile(r'(?i)(?:\d{1,3}(?:,\d{3})+|\d{3,7})\s*(?:km|miles|mi)')),
+    ('price', regex.compile(r'\$\s?[\d,]+')),
+)
+CAR_FIELDS = tuple(k for k, _ in CAR_RES)
+
 def car_assistant(text):
     # try to extract basic fields via regex, otherwise ask clarifying Qs or use AI
     fields = {}
-    # year
-    m = re.search(r'\b(19|20)\d{2}\b', text)
-    if m: fields['year'] = m.group(0)
-    # mileage
-    m = re.search(r'(\d{1,3}(?:,\d{3})+|\d{3,7})\s*(km|miles|mi)', text.lower())
-    if m: fields['mileage'] = m.group(0)
-    # price
-    m = re.search(r'\$\s?[\d,]+', text)
-    if m: fields['price'] = m.group(0)
+    for key, pattern in CAR_RES:
+        m = pattern.search(text)
+        if m:
+            fields[key] = m.group(0)
+    if 'mileage' in fields:
+        fields['mileage'] = fields['mileage'].lower()
     if len(fields) >= 2:
         # build suggested listing
         title = f"{fields.get('year','Year Unknown')} - Suggested Listing"
-        desc = " - ".join([f"{k.title()}: {v}" for k,v in fields.items()])
+        desc = " - ".join([f"{k.title()}: {fields[k]}" for k in CAR_FIELDS if k in fields])
         return f"I extracted: {desc}. Suggested title: '{title}'. You can refine details or provide more info."
     # fallback to AI if enabled
     if USE_AI:
@@ -251,26 +577,53 @@ def car_assistant(text):
 
 # ---------------- Session summary auto-trigger ----------------
 SUMMARY_TRIGGER = 20  # messages per session to auto-summarize
-def maybe_create_summary(session_id):
-    conn = get_db_connection(); c = conn.cursor()
-    c.execute('SELECT COUNT(*) FROM messages WHERE session_id=?', (session_id,))
-    count = c.fetchone()[0]
-    if count and count % SUMMARY_TRIGGER == 0:
-        # fetch recent messages for the session
-        c.execute('SELECT role, content FROM messages WHERE session_id=? ORDER BY id DESC LIMIT 200', (session_id,))
-        rows = c.fetchall()
-        messages_text = '\n'.join([f"{r['role']}: {r['content']}" for r in rows[::-1]])
-        summary = generate_summary_from_messages(session_id, messages_text)
-        now = datetime.utcnow().isoformat()
-        c.execute('INSERT INTO summaries (session_id, summary, created_at) VALUES (?,?,?)', (session_id, summary, now))
-        conn.commit(); conn.close()
-        # send to dashboard
+SUMMARY_BATCH_SIZE = 8    # summaries generated concurrently
+SUMMARY_BATCH_WAIT = 1.0  # seconds to wait for more due sessions before starting a batch
+SUMMARY_Q = queue.Queue()
+_SUMMARY_POOL = ThreadPoolExecutor(max_workers=SUMMARY_BATCH_SIZE, thread_name_prefix='summary')
+
+def session_transcript(conn, session_id):
+    # last 200 messages of a session, oldest first
+    rows = conn.execute('''SELECT role, content FROM (SELECT id, role, content FROM messages WHERE session_id=?
+                           ORDER BY id DESC LIMIT 200) ORDER BY id ASC''', (session_id,))
+    return '\n'.join(f"{r['role']}: {r['content']}" for r in rows)
+
+def create_summaries(session_ids):
+    # OpenAI calls run side by side on the pool; all summaries land in one commit
+    conn = get_db_connection()
+    texts = [session_transcript(conn, sid) for sid in session_ids]
+    summaries = list(_SUMMARY_POOL.map(generate_summary_from_messages, session_ids, texts))
+    now = utc_now()
+    conn.executemany('INSERT INTO summaries (session_id, summary, created_at) VALUES (?,?,?)',
+                     [(sid, summary, now) for sid, summary in zip(session_ids, summaries)])
+    conn.commit()
+    for sid, summary in zip(session_ids, summaries):
+        notify_dashboard('session_summary', {'sid': sid, 'summary': summary, 'time': now})
+
+def summary_worker_loop():
+    # fed by the message writer whenever a session's msg_count crosses a SUMMARY_TRIGGER multiple
+    while True:
+        batch = take_batch(SUMMARY_Q, SUMMARY_BATCH_SIZE, SUMMARY_BATCH_WAIT)
+        session_ids = list(dict.fromkeys(batch))
         try:
-            requests.post(f"{DASHBOARD_URL}/session_summary", json={'sid': session_id, 'summary': summary, 'time': now}, timeout=1.5)
-        except Exception:
-            pass
+            create_summaries(session_ids)
+        except sqlite3.Error as e:
+            app.logger.warning("dropped %d summaries: %s", len(session_ids), e)
+
+def start_summary_worker():
+    threading.Thread(target=summary_worker_loop, name='summary-worker', daemon=True).start()
+
+start_summary_worker()
 
 # ---------------- Endpoints ----------------
+def kb_reply(sid, text, kb_hits):
+    reply = f"{kb_hits[0][2]}\n\nType 'escalate' if you need further assistance."
+    log_message(sid, 'bot', reply)
+    send_analytics('kb_hit', {'sid': sid, 'query': text})
+    matches = [{'question': q, 'answer': a, 'score': score} for score, q, a in kb_hits]
+    return jsonify({'reply': reply, 'source': 'kb', 'matches': matches})
+
+ESCALATE_CMDS = frozenset({'escalate', 'open ticket', 'human', 'agent'})
 
 @app.route('/message', methods=['POST'])
 def message():
@@ -281,27 +634,27 @@ def message():
     sid = get_session_id()
     if not text:
         return jsonify({'error':'empty_message'}), 400
+    norm = text.lower()
 
-    save_user_profile(sid, name, email)
-    ok, reason = moderate_text(text)
-    if not ok:
-        log_message(sid, 'system', f'mod_block:{reason}')
-        return jsonify({'error': reason}), 403
+    blocked, intent = scan_message(text)
+    if blocked:
+        save_user_profile(sid, name, email)
+        log_message(sid, 'system', f'mod_block:{MOD_BLOCK_REASON}')
+        return jsonify({'error': MOD_BLOCK_REASON}), 403
 
-    log_message(sid, 'user', text)
-    # award small XP per message
-    award_xp(sid, 5)
+    # profile and a small XP award are committed together; the message itself is queued
+    record_user_turn(sid, name, email, text, xp=5)
 
     # commands
-    if text.lower().startswith('/'):
-        cmd = text.lower().split()
+    if norm.startswith('/'):
+        cmd = norm.split()
         if cmd[0] == '/rate':
             # format: /rate 8 optional note...
             try:
                 rating = int(cmd[1]); note = ' '.join(cmd[2:]) if len(cmd)>2 else ''
-                now = datetime.utcnow().isoformat()
+                now = utc_now()
                 conn = get_db_connection(); c = conn.cursor()
-                c.execute('INSERT INTO ratings (session_id, rating, note, created_at) VALUES (?,?,?,?)', (sid, rating, note, now)); conn.commit(); conn.close()
+                c.execute('INSERT INTO ratings (session_id, rating, note, created_at) VALUES (?,?,?,?)', (sid, rating, note, now)); conn.commit()
                 send_analytics('rating', {'sid': sid, 'rating': rating})
                 return jsonify({'reply': f"Thanks for your rating: {rating}"})
             except Exception:
@@ -309,46 +662,39 @@ def message():
         if cmd[0] == '/setmode':
             mode = cmd[1] if len(cmd)>1 else 'friendly'
             conn = get_db_connection(); c = conn.cursor()
-            c.execute('UPDATE users SET mode=? WHERE session_id=?', (mode, sid)); conn.commit(); conn.close()
+            c.execute('UPDATE users SET mode=? WHERE session_id=?', (mode, sid)); conn.commit()
             return jsonify({'reply': f"Mode set to {mode}"})
         if cmd[0] == '/favorite':
-            # save last bot message into favorites
+            # save last bot message into favorites; it may still be in the writer queue
+            flush_messages()
             conn = get_db_connection(); c = conn.cursor()
             c.execute('SELECT content FROM messages WHERE session_id=? AND role="bot" ORDER BY id DESC LIMIT 1', (sid,))
             r = c.fetchone()
             if r:
-                now = datetime.utcnow().isoformat()
-                c.execute('INSERT INTO favorites (session_id, content, created_at) VALUES (?,?,?)', (sid, r['content'], now)); conn.commit(); conn.close()
+                now = utc_now()
+                c.execute('INSERT INTO favorites (session_id, content, created_at) VALUES (?,?,?)', (sid, r['content'], now)); conn.commit()
                 return jsonify({'reply': 'Saved last bot message to favorites.'})
             return jsonify({'error':'no bot message to save'}), 400
 
     # simple escalate
-    if text.lower() in ('escalate', 'open ticket', 'human', 'agent'):
+    if norm in ESCALATE_CMDS:
         ticket_id = create_ticket(sid, "User requested escalation", text)
         reply = f"Escalation ticket #{ticket_id} created. Our team will reach out shortly."
         log_message(sid, 'bot', reply)
-        maybe_create_summary(sid)
         return jsonify({'reply': reply, 'ticket_id': ticket_id})
 
     # car assistant
-    if any(k in text.lower() for k in ('listing', 'sell my', 'car details', 'price suggestion', 'car assist', 'car_assist')):
+    if any(k in norm for k in ('listing', 'sell my', 'car details', 'price suggestion', 'car assist', 'car_assist')):
         assist = car_assistant(text)
         log_message(sid, 'bot', assist)
-        maybe_create_summary(sid)
         return jsonify({'reply': assist})
 
-    # KB search first
-    kb_hits = search_kb(text)
-    if kb_hits:
-        answer = kb_hits[0]['answer']
-        reply = f"{answer}\n\nType 'escalate' if you need further assistance."
-        log_message(sid, 'bot', reply)
-        maybe_create_summary(sid)
-        send_analytics('kb_hit', {'sid': sid, 'query': text})
-        return jsonify({'reply': reply, 'source': 'kb', 'matches': kb_hits})
+    # KB search first; a strong match answers ahead of the canned intents
+    kb_hits = search_kb(norm)
+    if kb_hits and kb_hits[0][0] >= KB_STRONG_SCORE:
+        return kb_reply(sid, text, kb_hits)
 
-    # detect intent & canned responses
-    intent = detect_intent(text)
+    # canned responses for the intent found by scan_message
     canned = {
         'availability': "If you share the listing ID, I can check availability.",
         'post_listing': "To post, go to Sellers > Add Listing and fill the required fields.",
@@ -361,61 +707,122 @@ def message():
     if intent in canned:
         reply = canned[intent]
         log_message(sid, 'bot', reply)
-        maybe_create_summary(sid)
         send_analytics('intent_response', {'sid': sid, 'intent': intent})
         return jsonify({'reply': reply, 'intent': intent})
 
+    # weaker KB matches still beat the AI / unknown fallback
+    if kb_hits:
+        return kb_reply(sid, text, kb_hits)
+
     # fallback to AI or unknown
     if USE_AI:
         ai_answer = ai_fallback_answer(text)
         log_message(sid, 'bot', ai_answer)
-        maybe_create_summary(sid)
         send_analytics('ai_response', {'sid': sid})
         return jsonify({'reply': ai_answer, 'source': 'ai'})
 
     # default unknown reply
     reply = "I didn't understand that. Type 'escalate' to open a ticket or ask another question."
     log_message(sid, 'bot', reply)
-    maybe_create_summary(sid)
     send_analytics('unknown', {'sid': sid})
     return jsonify({'reply': reply})
 
 # ---------------- tickets, admin, and utilities ----------------
 def create_ticket(session_id, subject, description):
-    now = datetime.utcnow().isoformat()
+    now = utc_now()
     conn = get_db_connection(); c = conn.cursor()
     c.execute('INSERT INTO tickets (session_id, subject, description, status, created_at, updated_at) VALUES (?,?,?,?,?,?)', (session_id, subject, description, 'open', now, now))
-    ticket_id = c.lastrowid; conn.commit(); conn.close()
-    # notify dashboard
-    try:
-        requests.post(f"{DASHBOARD_URL}/ticket_created", json={'sid': session_id, 'ticket_id': ticket_id, 'subject': subject, 'time': now}, timeout=1.5)
-    except Exception:
-        pass
+    ticket_id = c.lastrowid; conn.commit()
+    notify_dashboard('ticket_created', {'sid': session_id, 'ticket_id': ticket_id, 'subject': subject, 'time': now})
     return ticket_id
 
+def json_response(body):
+    # strong ETag over the encoded body so dashboard polls that see no change get an empty 304
+    resp = Response(body, mimetype='application/json')
+    resp.set_etag(hashlib.blake2b(body, digest_size=16).hexdigest())
+    resp.cache_control.no_cache = True  # always revalidate, never serve stale
+    return resp.make_conditional(request)
+
+def conditional_json(payload):
+    return json_response(app.json.dumps(payload).encode('utf-8'))
+
+TICKET_COLS = ('id', 'session_id', 'subject', 'status', 'created_at')
+LEADERBOARD_COLS = ('name', 'xp', 'level')
+
+def ticket_rows(limit=200):
+    c = get_db_connection().cursor(); c.row_factory = None  # plain tuples, zipped below
+    c.execute('SELECT id, session_id, subject, status, created_at FROM tickets ORDER BY created_at DESC LIMIT ?', (limit,))
+    return [dict(zip(TICKET_COLS, r)) for r in c.fetchall()]
+
 @app.route('/tickets', methods=['GET'])
 def tickets():
     key = request.args.get('admin_key') or request.headers.get('X-ADMIN-KEY')
     if key != ADMIN_KEY:
         return jsonify({'error':'unauthorized'}), 401
-    conn = get_db_connection(); c = conn.cursor()
-    c.execute('SELECT id, session_id, subject, status, created_at FROM tickets ORDER BY created_at DESC LIMIT 200')
-    rows = [dict(r) for r in c.fetchall()]; conn.close()
-    return jsonify(rows)
+    limit = max(1, min(request.args.get('limit', 200, type=int), 200))
+    return conditional_json(ticket_rows(limit))
+
+@app.route('/history', methods=['GET'])
+def history():
+    key = request.args.get('admin_key') or request.headers.get('X-ADMIN-KEY')
+    if key != ADMIN_KEY:
+        return jsonify({'error':'unauthorized'}), 401
+    sid = request.args.get('sid')
+    if not sid:
+        return jsonify({'error':'missing sid'}), 400
+    # keyset pagination: newest first, pass the last id seen as ?before_id= for the next page
+    before_id = request.args.get('before_id', type=int)
+    if before_id is None:
+        before_id = 2**63 - 1
+    limit = max(1, min(request.args.get('limit', 100, type=int), 500))
+    def generate():
+        conn = get_db_connection(); c = conn.cursor()
+        c.execute('SELECT id, role, content, created_at FROM messages WHERE session_id=? AND id<? ORDER BY id DESC LIMIT ?', (sid, before_id, limit))
+        yield '['
+        for i, r in enumerate(c):
+            yield (',' if i else '') + app.json.dumps(dict(r))
+        yield ']'
+    return Response(stream_with_context(generate()), mimetype='application/json')
+
+@app.route('/kb_reload', methods=['POST'])
+def kb_reload():
+    key = request.args.get('admin_key') or request.headers.get('X-ADMIN-KEY')
+    if key != ADMIN_KEY:
+        return jsonify({'error':'unauthorized'}), 401
+    conn = get_db_connection()
+    conn.execute('UPDATE kb_meta SET version = version + 1 WHERE id=1'); conn.commit()
+    load_kb()
+    return jsonify({'status': 'reloaded', 'articles': len(_KB[0])})
+
+LEADERBOARD_TTL = 2.0  # seconds a served leaderboard may lag behind xp awards
+_LB_CACHE = (0.0, (), b'[]')  # (expires, top 50 rows, their JSON body), an immutable snapshot
+
+def leaderboard_rows():
+    # xp moves on every user turn, so the top 50 is re-read at most once per TTL per worker.
+    # readers never lock: a refresh builds a new snapshot and rebinds _LB_CACHE in one step,
+    # and a concurrent duplicate refresh just writes an equally fresh copy
+    global _LB_CACHE
+    if time.monotonic() >= _LB_CACHE[0]:
+        c = get_db_connection().cursor(); c.row_factory = None  # plain tuples, zipped below
+        c.execute('SELECT name, xp, level FROM users ORDER BY level DESC, xp DESC LIMIT 50')
+        rows = tuple(dict(zip(LEADERBOARD_COLS, r)) for r in c.fetchall())
+        _LB_CACHE = (time.monotonic() + LEADERBOARD_TTL, rows, app.json.dumps(rows).encode('utf-8'))
+    return _LB_CACHE
 
 @app.route('/leaderboard', methods=['GET'])
 def leaderboard():
-    conn = get_db_connection(); c = conn.cursor()
-    c.execute('SELECT name, xp, level FROM users ORDER BY level DESC, xp DESC LIMIT 50')
-    rows = [dict(r) for r in c.fetchall()]; conn.close()
-    return jsonify(rows)
+    limit = max(1, min(request.args.get('limit', 50, type=int), 50))
+    _, rows, body = leaderboard_rows()
+    if limit < len(rows):
+        return conditional_json(rows[:limit])
+    return json_response(body)
 
 @app.route('/summaries', methods=['GET'])
 def summaries():
     sid = request.args.get('sid') or get_session_id()
     conn = get_db_connection(); c = conn.cursor()
     c.execute('SELECT summary, created_at FROM summaries WHERE session_id=? ORDER BY id DESC LIMIT 20', (sid,))
-    rows = [dict(r) for r in c.fetchall()]; conn.close()
+    rows = [dict(r) for r in c.fetchall()]
     return jsonify(rows)
 
 @app.route('/favorites', methods=['GET'])
@@ -423,7 +830,7 @@ def favorites():
     sid = request.args.get('sid') or get_session_id()
     conn = get_db_connection(); c = conn.cursor()
     c.execute('SELECT content, created_at FROM favorites WHERE session_id=? ORDER BY id DESC', (sid,))
-    rows = [dict(r) for r in c.fetchall()]; conn.close()
+    rows = [dict(r) for r in c.fetchall()]
     return jsonify(rows)
 
 @app.route('/stats', methods=['GET'])
@@ -437,26 +844,67 @@ def stats():
     c.execute('SELECT COUNT(DISTINCT session_id) as sessions FROM messages'); sessions = c.fetchone()['sessions']
     c.execute('SELECT COUNT(*) FROM tickets WHERE status="open"'); open_tickets = c.fetchone()[0]
     c.execute('SELECT name, xp, level FROM users ORDER BY level DESC, xp DESC LIMIT 10'); top = [dict(r) for r in c.fetchall()]
-    conn.close()
     return jsonify({'messages': msgs, 'sessions': sessions, 'open_tickets': open_tickets, 'top_users': top})
 
 # health
+def health_payload():
+    return {'status':'ok', 'time': utc_now(), 'ai_enabled': USE_AI}
+
 @app.route('/health', methods=['GET'])
 def health():
-    return jsonify({'status':'ok', 'time': datetime.utcnow().isoformat(), 'ai_enabled': USE_AI})
+    return jsonify(health_payload())
+
+def user_rows(limit=100):
+    # most recently active sessions, for the dashboard's session picker and achievements panel
+    c = get_db_connection().cursor(); c.row_factory = None
+    c.execute('SELECT session_id, name, last_seen, ach_mask FROM users ORDER BY last_seen DESC LIMIT ?', (limit,))
+    return [{'session_id': sid, 'name': name, 'last_seen': last_seen,
+             'achievements': ', '.join(achievement_names(mask))} for sid, name, last_seen, mask in c.fetchall()]
+
+# everything the admin dashboard polls, in one round trip
+@app.route('/dashboard_snapshot', methods=['GET'])
+def dashboard_snapshot():
+    key = request.args.get('admin_key') or request.headers.get('X-ADMIN-KEY')
+    if key != ADMIN_KEY:
+        return jsonify({'error':'unauthorized'}), 401
+    # health without its timestamp, so an unchanged snapshot keeps its ETag between polls
+    return conditional_json({'tickets': ticket_rows(), 'leaderboard': leaderboard_rows()[1],
+                             'users': user_rows(), 'health': {'status': 'ok', 'ai_enabled': USE_AI}})
 
 # quick helpers to read messages count (used by summary trigger on demand)
 @app.route('/msg_count', methods=['GET'])
 def msg_count():
     sid = request.args.get('sid') or get_session_id()
     conn = get_db_connection(); c = conn.cursor()
-    c.execute('SELECT COUNT(*) FROM messages WHERE session_id=?', (sid,))
-    cnt = c.fetchone()[0]; conn.close()
-    return jsonify({'count': cnt})
+    # maintained by the message writer, so this is a primary-key read rather than a COUNT(*)
+    c.execute('SELECT msg_count FROM users WHERE session_id=?', (sid,))
+    row = c.fetchone()
+    return jsonify({'count': row[0] if row else 0})
+
+# ---------------- process lifecycle ----------------
+def after_fork():
+    # gunicorn --preload forks after import: sqlite connections, locks and threads
+    # must not be shared with the parent, so give each worker its own
+    global _local, MSG_Q, EVENT_Q, SUMMARY_Q, _SUMMARY_POOL
+    _local = threading.local()
+    MSG_Q = queue.Queue()
+    EVENT_Q = queue.Queue(maxsize=10000)
+    SUMMARY_Q = queue.Queue()
+    _SUMMARY_POOL = ThreadPoolExecutor(max_workers=SUMMARY_BATCH_SIZE, thread_name_prefix='summary')
+    start_db_maintenance()
+    start_message_writer()
+    start_summary_worker()
+    start_dashboard_sync()
 
 # ----------------- run -----------------
 if __name__ == '__main__':
     init_db()
     seed_kb()
     print("Evolve Bot running on http://127.0.0.1:5000")
-    app.run(host='0.0.0.0', port=5000, debug=True)
+    # production deploys should prefer gunicorn (see gunicorn.conf.py)
+    try:
+        from waitress import serve
+    except ImportError:
+        app.run(host='0.0.0.0', port=5000, debug=True)
+    else:
+        serve(app, host='0.0.0.0', port=5000, threads=16)
@@ -7,15 +7,24 @@ Admin console for Rugike Motors Support Bot with gamification.
 Run:
   BACKEND_URL=http://127.0.0.1:5000 ADMIN_KEY=admin-secret-key python evolve_dashboard.py
 """
-from flask import Flask, render_template_string, jsonify, request
-import os
+from flask import Flask, Response, jsonify, request
+import os, gzip, hashlib, time, queue, threading, requests
+from requests.adapters import HTTPAdapter
+from urllib.parse import parse_qs
+from fastjson import use_orjson
 
 app = Flask(__name__)
 app.secret_key = os.environ.get('BOT_SECRET_KEY', 'local-secret')
+use_orjson(app)
 
 # Backend support-bot URL (evolve.py)
 BACKEND_URL = os.environ.get('BACKEND_URL', 'http://127.0.0.1:5000')
 ADMIN_KEY = os.environ.get('ADMIN_KEY', 'admin-secret-key')
+# one pooled keep-alive session for every backend call; sized for waitress's 16 threads
+_http = requests.Session()
+_http.mount('http://', HTTPAdapter(pool_connections=10, pool_maxsize=20, max_retries=1))
+_http.mount('https://', HTTPAdapter(pool_connections=10, pool_maxsize=20, max_retries=1))
+_http.headers['X-ADMIN-KEY'] = ADMIN_KEY
 
 TEMPLATE = """ 
 <!-- Keep your existing HTML/CSS as before, but add sections for leaderboard and achievements -->
@@ -25,9 +34,7 @@ TEMPLATE = """
 <meta charset="utf-8" />
 <title>Rugike Motors — Support Dashboard</title>
 <meta name="viewport" content="width=device-width,initial-scale=1" />
-<style>
-/* ... keep your existing styles ... */
-</style>
+<link rel="stylesheet" href="/static/dash.css?v={{ assets['dash.css'] }}" />
 </head>
 <body>
 <header>
@@ -90,146 +97,244 @@ TEMPLATE = """
       <div id="health" class="badge">—</div>
       <div id="metricTickets" class="muted">Tickets: —</div>
       <div id="metricUsers" class="muted">Users: —</div>
-      <pre id="eventLog">No events yet.</pre>
+      <div id="eventLog" style="font-family:monospace;white-space:pre-wrap"><div>No events yet.</div></div>
     </div>
   </div>
 </div>
 
-<script>
-const BACKEND = "{{ backend_url }}";
-const ADMIN_KEY = "{{ admin_key }}";
-let autoRefresh = false;
-let eventLog = [];
-
-function pushEvent(msg){
-  const ts = new Date().toLocaleString();
-  eventLog.unshift(`[${ts}] ${msg}`);
-  if(eventLog.length>50) eventLog.pop();
-  document.getElementById('eventLog').innerText = eventLog.join('\\n');
-}
-
-async function beFetch(path, opts={}) {
-  const url = BACKEND.replace(/\\/$/,'') + path;
-  opts.headers = opts.headers || {};
-  if(ADMIN_KEY) opts.headers['X-ADMIN-KEY'] = ADMIN_KEY;
-  try {
-    const res = await fetch(url, opts);
-    if(!res.ok){ pushEvent(`Error ${res.status} on ${path}`); return null; }
-    return await res.json();
-  } catch(e){ pushEvent(`Fetch error on ${path}: ${e}`); return null; }
-}
-
-// Refresh all panels
-async function refreshAll(){
-  await Promise.all([loadTickets(), loadLeaderboard(), loadUsers(), loadSessions(), loadHealth()]);
-  pushEvent('Refreshed all panels');
-}
-
-// Load tickets
-async function loadTickets(){
-  const data = await beFetch('/tickets');
-  const el = document.getElementById('tickets'); el.innerHTML = '';
-  if(!data){ el.innerHTML='<li class="muted">Unable to load tickets</li>'; return; }
-  document.getElementById('ticketCount').innerText = data.length + ' open';
-  document.getElementById('metricTickets').innerText = 'Tickets: ' + data.length;
-  for(const t of data){
-    const li = document.createElement('li');
-    li.innerHTML = `<strong>#${t.id}</strong> [${t.status}] ${t.subject}`;
-    li.onclick=()=>alert(`Ticket #${t.id}\n${t.subject}`);
-    el.appendChild(li);
-  }
-}
-
-// Leaderboard
-async function loadLeaderboard(){
-  const data = await beFetch('/leaderboard');
-  const el = document.getElementById('leaderboard'); el.innerHTML='';
-  if(!data){ el.innerHTML='<li class="muted">Unable to load leaderboard</li>'; return; }
-  for(const u of data.slice(0,20)){
-    const li = document.createElement('li');
-    li.innerHTML=`<strong>${u.name||u.session_id}</strong> - Level ${u.level} (${u.xp} XP)`;
-    el.appendChild(li);
-  }
-}
-
-// Load users (for conversation selection)
-async function loadUsers(){
-  const data = await beFetch('/users');
-  if(!data) return;
-  const select = document.getElementById('sessionSelect'); select.innerHTML='<option value="">-- select session --</option>';
-  for(const u of data){
-    const opt = document.createElement('option'); opt.value=u.session_id; opt.textContent=(u.name||u.session_id).slice(0,30)+' — '+(u.last_seen||'');
-    select.appendChild(opt);
-  }
-  // Load achievements panel
-  const achEl = document.getElementById('achievements'); achEl.innerHTML='';
-  for(const u of data.slice(0,10)){ // top 10 for brevity
-    const li = document.createElement('li'); li.innerText=`${u.name||u.session_id}: ${u.achievements||'—'}`;
-    achEl.appendChild(li);
-  }
-}
-
-// Sessions dropdown
-async function loadSessions(){ await loadUsers(); }
-
-// Conversations
-async function loadConversation(){
-  const sid = document.getElementById('sessionSelect').value;
-  if(!sid) return;
-  const rows = await beFetch('/history?sid=' + encodeURIComponent(sid));
-  const wrap = document.getElementById('conversation'); wrap.innerHTML='';
-  if(!rows){ wrap.innerHTML='<div class="muted">Unable to load conversation</div>'; return; }
-  for(const r of rows){
-    const d = document.createElement('div'); d.style.marginBottom='8px';
-    d.innerHTML=`<div style="font-size:13px;color:#9aa6b2">${r.created_at}</div>
-                 <div style="padding:8px;background:rgba(255,255,255,.02);border-radius:6px"><strong>${r.role}</strong>: ${r.content}</div>`;
-    wrap.appendChild(d);
-  }
-  pushEvent('Loaded conversation for ' + sid);
-}
-
-// KB
-async function searchKB(){
-  const q = document.getElementById('kbQuery').value.trim(); if(!q) return;
-  const data = await beFetch('/kb?q=' + encodeURIComponent(q));
-  const el = document.getElementById('kbResults'); el.innerHTML='';
-  if(!data || data.length===0){ el.innerHTML='<div class="muted">No KB hits</div>'; return; }
-  for(const item of data){
-    const div = document.createElement('div'); div.innerHTML=`<strong>${item.question}</strong><div>${item.answer}</div>`; el.appendChild(div);
-  }
-  pushEvent('KB search: ' + q);
-}
-
-async function addKB(){
-  const q=document.getElementById('kbQ').value.trim();
-  const a=document.getElementById('kbA').value.trim();
-  const tags=document.getElementById('kbTags').value.trim();
-  if(!q||!a){ document.getElementById('kbMsg').innerText='Q&A required'; return; }
-  const res = await beFetch('/admin/kb/add',{method:'POST',body:JSON.stringify({question:q,answer:a,tags:tags}),headers:{'Content-Type':'application/json'}});
-  if(res && res.status==='added'){ document.getElementById('kbMsg').innerText='Added'; pushEvent('KB article added'); } else { document.getElementById('kbMsg').innerText='Failed to add'; }
-}
-
-async function loadHealth(){
-  const h = await beFetch('/health'); const el=document.getElementById('health');
-  if(!h){ el.innerText='DOWN'; el.style.background='#600'; return; }
-  el.innerText = h.status==='ok'?'OK':'WARN'; el.style.background = h.status==='ok'?'#072a17':'#604217';
-  pushEvent('Health checked');
-}
-
-function toggleAuto(){ autoRefresh=!autoRefresh; document.getElementById('autoState').innerText=autoRefresh?'ON':'OFF'; if(autoRefresh) autoLoop(); }
-async function autoLoop(){ while(autoRefresh){ await refreshAll(); await new Promise(r=>setTimeout(r,7000)); } }
-
-// Initial load
-refreshAll();
-</script>
+<script src="/static/admin.js?v={{ assets['admin.js'] }}" defer></script>
 </body>
 </html>
 """
 
+# static assets are linked as ?v=<content hash>, so a changed file gets a new URL and the
+# old one can be cached by browsers indefinitely
+def asset_version(name):
+    with open(os.path.join(app.static_folder, name), 'rb') as f:
+        return hashlib.blake2b(f.read(), digest_size=4).hexdigest()
+
+ASSET_VERSIONS = {name: asset_version(name) for name in ('admin.js', 'dash.css')}
+
+@app.after_request
+def cache_versioned_assets(resp):
+    if (request.endpoint == 'static' and resp.status_code == 200
+            and request.args.get('v') == ASSET_VERSIONS.get(request.view_args.get('filename'))):
+        resp.headers['Cache-Control'] = 'public, max-age=31536000, immutable'
+    return resp
+
+# the template inputs are fixed for the process lifetime, so the page is compiled and rendered
+# exactly once; only the bytes are kept, the compiled template is left for the GC
+HOME_HTML = app.jinja_env.from_string(TEMPLATE).render(backend_url=BACKEND_URL, assets=ASSET_VERSIONS).encode('utf-8')
+HOME_HTML_GZ = gzip.compress(HOME_HTML, 9)  # compressed once too; most browsers accept it
+HOME_ETAG = hashlib.blake2b(HOME_HTML, digest_size=16).hexdigest()
+
 @app.route("/")
 def home():
-    return render_template_string(TEMPLATE, backend_url=BACKEND_URL, admin_key=ADMIN_KEY)
+    if 'gzip' in request.accept_encodings:
+        resp = Response(HOME_HTML_GZ, mimetype='text/html')
+        resp.headers['Content-Encoding'] = 'gzip'
+        resp.set_etag(HOME_ETAG + '-gz')  # each encoding is its own representation
+    else:
+        resp = Response(HOME_HTML, mimetype='text/html')
+        resp.set_etag(HOME_ETAG)
+    resp.vary.add('Accept-Encoding')
+    # revalidate every load; reloads of an unchanged page get an empty 304
+    resp.cache_control.no_cache = True
+    return resp.make_conditional(request)
+
+# ---------------- backend proxy ----------------
+# proxied GETs are shared for PROXY_CACHE_TTL seconds, so several tabs and auto-refresh
+# bursts cost one backend hit; concurrent misses on a url wait on the same striped lock
+# and reuse the first response instead of each going upstream
+PROXY_CACHE_TTL = 3.0
+PROXY_CACHE_SIZE = 256
+GZIP_MIN_SIZE = 512  # smaller bodies aren't worth a gzip frame
+_proxy_cache = {}  # url -> (expires, status, content_type, etag, body, gzipped body or None)
+_proxy_cache_lock = threading.Lock()
+_PROXY_LOCKS = tuple(threading.Lock() for _ in range(16))
+
+def cached_get(url):
+    hit = _proxy_cache.get(url)
+    if hit and hit[0] > time.monotonic():
+        return hit
+    with _PROXY_LOCKS[hash(url) % len(_PROXY_LOCKS)]:
+        hit = _proxy_cache.get(url)
+        if hit and hit[0] > time.monotonic():
+            return hit
+        r = _http.get(url, timeout=3)
+        body = r.content
+        gz = gzip.compress(body, 6) if r.status_code == 200 and len(body) >= GZIP_MIN_SIZE else None
+        hit = (time.monotonic() + PROXY_CACHE_TTL, r.status_code, r.headers.get('Content-Type'),
+               r.headers.get('ETag'), body, gz)
+        if r.status_code == 200:
+            with _proxy_cache_lock:
+                if len(_proxy_cache) >= PROXY_CACHE_SIZE:
+                    del _proxy_cache[next(iter(_proxy_cache))]  # oldest insert first
+                _proxy_cache[url] = hit
+        return hit
+
+def send_payload(body, content_type, status=200, etag=None, gz=None, weak=False):
+    # gzip when the client takes it, one ETag per encoding, and If-None-Match answered with a 304
+    use_gz = gz is not None and 'gzip' in request.accept_encodings
+    resp = Response(gz if use_gz else body, status=status, content_type=content_type)
+    if gz is not None:
+        resp.vary.add('Accept-Encoding')
+    if use_gz:
+        resp.headers['Content-Encoding'] = 'gzip'
+    if etag and status == 200:
+        resp.set_etag(etag.strip('"') + ('-gz' if use_gz else ''), weak=weak)
+        resp.cache_control.no_cache = True
+        return resp.make_conditional(request)
+    return resp
+
+def backend_url(sub):
+    url = f"{BACKEND_URL}/{sub}"
+    if request.query_string:
+        url += '?' + request.query_string.decode('latin-1')
+    return url
+
+# every panel the dashboard polls, in one same-origin call; the backend assembles them
+@app.route("/api/dashboard")
+def api_dashboard():
+    try:
+        _, status, _, etag, body, _ = cached_get(f"{BACKEND_URL}/dashboard_snapshot")
+        if status != 200:
+            raise ValueError(f'status {status}')
+        # unchanged snapshot: answer the revalidation before any decode / re-encode / gzip
+        tag = etag.strip('"') if etag else None
+        for held in ((tag, tag + '-gz') if tag else ()):
+            if request.if_none_match.contains_weak(held):
+                resp = Response(status=304)
+                resp.set_etag(held, weak=True)
+                resp.cache_control.no_cache = True
+                resp.vary.add('Accept-Encoding')
+                return resp
+        snap = app.json.loads(body)
+    except (requests.RequestException, ValueError) as e:
+        return jsonify({'error': f'backend unavailable: {e}', 'ts': time.time()}), 502
+    snap['ts'] = time.time()
+    body = app.json.dumps(snap).encode('utf-8')
+    gz = gzip.compress(body, 6) if len(body) >= GZIP_MIN_SIZE else None
+    # weak: same snapshot as the backend's strong tag, but our body also carries ts
+    return send_payload(body, 'application/json', etag=etag, gz=gz, weak=True)
+
+# the backend calls admin.js makes, and nothing else: the proxy attaches the admin key,
+# so it must not relay arbitrary paths or requests another site can forge
+PROXY_ROUTES = {'history': 'GET', 'kb': 'GET', 'admin/kb/add': 'POST'}
+
+def same_origin():
+    # browsers always send one of these on cross-site requests; a missing header means
+    # a non-browser client, which can't ride on someone else's session anyway
+    site = request.headers.get('Sec-Fetch-Site')
+    if site is not None:
+        return site in ('same-origin', 'none')
+    origin = request.headers.get('Origin')
+    return origin is None or origin.rstrip('/') == request.host_url.rstrip('/')
+
+# everything else the page needs from the backend; the admin key is added here, server-side,
+# so it never reaches the browser
+@app.route("/api/<path:sub>", methods=["GET", "POST"])
+def api_proxy(sub):
+    if PROXY_ROUTES.get(sub) != request.method:
+        return jsonify({'error': 'not found'}), 404
+    if not same_origin():
+        return jsonify({'error': 'cross-origin request refused'}), 403
+    url = backend_url(sub)
+    try:
+        if request.method == 'GET':
+            _, status, content_type, etag, body, gz = cached_get(url)
+            return send_payload(body, content_type, status, etag, gz)
+        # a JSON body can't be sent cross-site without a CORS preflight, which is never granted
+        if request.mimetype != 'application/json':
+            return jsonify({'error': 'expected application/json'}), 415
+        r = _http.post(url, data=request.get_data(), headers={'Content-Type': request.content_type},
+                       stream=True, timeout=3)
+    except requests.RequestException as e:
+        return jsonify({'error': f'backend unavailable: {e}'}), 502
+    def body():
+        try:
+            yield from r.iter_content(8192)
+        finally:
+            r.close()
+    return Response(body(), status=r.status_code, content_type=r.headers.get('Content-Type'))
+
+# ---------------- live events ----------------
+# evolve.py POSTs batches of events to /batch; each open /api/stream connection has its own
+# bounded queue of batches and relays them to the browser as server-sent events
+STREAM_QUEUE_SIZE = 256
+STREAM_PING = 15  # seconds between keep-alive comments on an idle stream
+# every open stream pins a server thread, so streams are capped well below SERVER_THREADS;
+# past the cap a client gets a 503 and stays on polling
+SERVER_THREADS = 16
+MAX_STREAMS = 8
+_subscribers = set()
+_subscribers_lock = threading.Lock()
+
+def invalidate_history(sids):
+    # a new message makes that session's cached /history pages stale; every other cached
+    # response just ages out through PROXY_CACHE_TTL
+    if not sids:
+        return
+    prefix = f"{BACKEND_URL}/history?"
+    with _proxy_cache_lock:
+        stale = [url for url in _proxy_cache
+                 if url.startswith(prefix) and parse_qs(url[len(prefix):]).get('sid', [None])[0] in sids]
+        for url in stale:
+            del _proxy_cache[url]
+
+@app.route("/batch", methods=["POST"])
+def batch():
+    if request.headers.get('X-ADMIN-KEY') != ADMIN_KEY:
+        return jsonify({'error': 'unauthorized'}), 401
+    events = [ev for ev in (request.get_json(silent=True) or []) if isinstance(ev, dict)]
+    invalidate_history({ev['payload'].get('sid') for ev in events
+                        if ev.get('event') == 'log_message' and isinstance(ev.get('payload'), dict)})
+    with _subscribers_lock:
+        subscribers = list(_subscribers)
+    for q in subscribers:
+        try:
+            q.put_nowait(events)
+        except queue.Full:
+            pass  # stalled client; its next refresh resyncs the panels
+    return jsonify({'status': 'ok', 'received': len(events)})
+
+def sse_frame(ev):
+    return f"event: {ev.get('event', 'message')}\ndata: {app.json.dumps(ev)}\n\n"
+
+@app.route("/api/stream")
+def api_stream():
+    q = queue.Queue(maxsize=STREAM_QUEUE_SIZE)
+    with _subscribers_lock:
+        if len(_subscribers) >= MAX_STREAMS:
+            return jsonify({'error': 'too many live streams'}), 503
+        _subscribers.add(q)
+    def generate():
+        yield 'retry: 3000\n\n'
+        while True:
+            try:
+                events = q.get(timeout=STREAM_PING)
+            except queue.Empty:
+                yield ': ping\n\n'  # also how a closed connection gets noticed
+                continue
+            yield ''.join(sse_frame(ev) for ev in events)
+    def unsubscribe():
+        with _subscribers_lock:
+            _subscribers.discard(q)
+    resp = Response(generate(), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+    # runs when the server closes the response, even if the body was never iterated
+    resp.call_on_close(unsubscribe)
+    return resp
 
 if __name__=="__main__":
     print("Dashboard running on http://127.0.0.1:5001 — backend:", BACKEND_URL)
-    app.run(port=5001, debug=True)
+    # FLASK_DEBUG=1 brings back the reloader and debugger for local development
+    if os.environ.get('FLASK_DEBUG', '0') == '1':
+        app.run(port=5001, debug=True)
+    else:
+        try:
+            from waitress import serve
+        except ImportError:
+            app.run(port=5001)
+        else:
+            serve(app, host='127.0.0.1', port=5001, threads=SERVER_THREADS)
@@ -0,0 +1,22 @@
+"""
+gunicorn.conf.py - production serving for evolve.py
+---------------------------------------------------
+Run:
+  gunicorn evolve:app
+
+preload_app imports evolve once in the master (init_db, seed_kb, KB index,
+compiled regexes) and forks workers that share that state; post_fork then
+gives each worker fresh SQLite connections and background threads.
+"""
+import multiprocessing
+import os
+
+bind = os.environ.get('BIND', '0.0.0.0:5000')
+workers = int(os.environ.get('WEB_CONCURRENCY', multiprocessing.cpu_count()))
+worker_class = 'gthread'
+threads = int(os.environ.get('THREADS', 4))
+preload_app = True
+
+def post_fork(server, worker):
+    import evolve
+    evolve.after_fork()
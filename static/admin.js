@@ -0,0 +1,255 @@
+// admin dashboard client; every call is same-origin, the dashboard server holds the admin key
+let autoRefresh = false;
+let autoTimer = null;
+let eventCount = 0;
+
+// newest first, capped at 50 lines: one node in, at most one node out per event
+function pushEvent(msg){
+  const el = document.getElementById('eventLog');
+  if(!eventCount++) el.replaceChildren();  // drop the "No events yet." placeholder
+  const line = document.createElement('div');
+  line.textContent = `[${new Date().toLocaleString()}] ${msg}`;
+  el.insertBefore(line, el.firstChild);
+  if(el.childElementCount > 50) el.lastElementChild.remove();
+}
+
+async function getJSON(url, path, opts={}) {
+  try {
+    const res = await fetch(url, opts);
+    if(!res.ok){ pushEvent(`Error ${res.status} on ${path}`); return null; }
+    return await res.json();
+  } catch(e){
+    if(e.name !== 'AbortError') pushEvent(`Fetch error on ${path}: ${e}`);  // aborts are deliberate
+    return null;
+  }
+}
+
+// concurrent identical GETs share one network request (not cancellable ones: an abort
+// would cancel it for every caller)
+const inflight = new Map();
+function fetchJSON(url, path, opts={}) {
+  if((opts.method || 'GET') !== 'GET' || opts.signal) return getJSON(url, path, opts);
+  if(inflight.has(url)) return inflight.get(url);
+  const p = getJSON(url, path, opts).finally(()=>inflight.delete(url));
+  inflight.set(url, p);
+  return p;
+}
+
+// backend calls, relayed by the dashboard's /api proxy
+async function beFetch(path, opts={}) { return fetchJSON('/api' + path, path, opts); }
+
+// same-origin calls to the dashboard server
+async function apiFetch(path, opts={}) { return fetchJSON(path, path, opts); }
+
+// Refresh all panels from one round trip. The button, the auto timer and tab switches all
+// land here: a call made while a refresh is running shares it, and one made within
+// REFRESH_MIN_MS of the last completed refresh is a no-op.
+const REFRESH_MIN_MS = 2000;
+let lastRefresh = 0, pendingRefresh = null;
+function refreshAll(){
+  if(pendingRefresh) return pendingRefresh;
+  if(Date.now() - lastRefresh < REFRESH_MIN_MS) return Promise.resolve();
+  pendingRefresh = (async()=>{
+    try {
+      const s = await apiFetch('/api/dashboard') || {};
+      renderTickets(s.tickets); renderLeaderboard(s.leaderboard); renderUsers(s.users); renderHealth(s.health);
+      pushEvent('Refreshed all panels');
+      lastRefresh = Date.now();
+    } finally { pendingRefresh = null; }
+  })();
+  return pendingRefresh;
+}
+
+// Row shells are parsed once and cloned per row; data only ever goes in via textContent,
+// so no per-row HTML parsing and nothing in a message can turn into markup
+function rowShell(html){
+  const t = document.createElement('template'); t.innerHTML = html.trim();
+  return t.content.firstElementChild;
+}
+
+// Keyed list diff for the polled panels: rows whose key is still present are reused, only
+// rows whose signature changed are patched, and nodes move only when the order changed.
+// An unchanged refresh touches no DOM at all, so scroll position and selection survive.
+function syncList(el, rendered, items, key, sig, build, patch){
+  if(!rendered.size) el.replaceChildren();  // drop any placeholder text
+  const next = new Map();
+  let cursor = el.firstChild;
+  for(const item of items){
+    const k = key(item), s = sig(item);
+    const row = rendered.get(k) || {node: build(), sig: null};
+    if(row.sig !== s){ patch(row.node, item); row.sig = s; }
+    next.set(k, row);
+    if(row.node === cursor) cursor = cursor.nextSibling;
+    else el.insertBefore(row.node, cursor);
+  }
+  for(const [k, row] of rendered) if(!next.has(k)) row.node.remove();
+  return next;
+}
+
+// Tickets
+const TICKET_ROW = rowShell('<li><strong></strong> <span></span></li>');
+let ticketData = [], ticketRows = new Map();
+function renderTickets(data){
+  const el = document.getElementById('tickets');
+  if(!data){ el.innerHTML='<li class="muted">Unable to load tickets</li>'; ticketRows = new Map(); return; }
+  ticketData = data;
+  document.getElementById('ticketCount').innerText = data.length + ' open';
+  document.getElementById('metricTickets').innerText = 'Tickets: ' + data.length;
+  ticketRows = syncList(el, ticketRows, data, t=>t.id, t=>t.status+'\n'+t.subject,
+    ()=>TICKET_ROW.cloneNode(true),
+    (li, t)=>{
+      li.firstChild.textContent = '#' + t.id;
+      li.lastChild.textContent = `[${t.status}] ${t.subject}`;
+      li.onclick=()=>alert(`Ticket #${t.id}\n${t.subject}`);
+    });
+}
+
+// Leaderboard
+const LEADER_ROW = rowShell('<li><strong></strong> - <span></span></li>');
+function renderLeaderboard(data){
+  const el = document.getElementById('leaderboard');
+  if(!data){ el.innerHTML='<li class="muted">Unable to load leaderboard</li>'; return; }
+  const frag = document.createDocumentFragment();
+  for(const u of data.slice(0,20)){
+    const li = LEADER_ROW.cloneNode(true);
+    li.firstChild.textContent = u.name||u.session_id;
+    li.lastChild.textContent = `Level ${u.level} (${u.xp} XP)`;
+    frag.appendChild(li);
+  }
+  el.replaceChildren(frag);
+}
+
+// Users: fill both the session dropdown and the achievements panel
+let sessionOptions = new Map(), achievementRows = new Map();
+function renderUsers(data){
+  if(!data) return;
+  // diffing the options keeps the open conversation selected
+  const labels = [{session_id:'', label:'-- select session --'},
+    ...data.map(u=>({session_id:u.session_id, label:(u.name||u.session_id).slice(0,30)+' — '+(u.last_seen||'')}))];
+  sessionOptions = syncList(document.getElementById('sessionSelect'), sessionOptions, labels,
+    o=>o.session_id, o=>o.label, ()=>new Option(), (opt, o)=>{ opt.value = o.session_id; opt.textContent = o.label; });
+  // Load achievements panel
+  achievementRows = syncList(document.getElementById('achievements'), achievementRows, data.slice(0,10), // top 10 for brevity
+    u=>u.session_id, u=>`${u.name||u.session_id}: ${u.achievements||'—'}`,
+    ()=>document.createElement('li'), (li, u)=>{ li.textContent = `${u.name||u.session_id}: ${u.achievements||'—'}`; });
+}
+
+// Conversations
+// switching sessions or searching again cancels the superseded request, so a slow
+// earlier response can never overwrite the newer one
+let convoCtl = null, kbCtl = null;
+async function loadConversation(){
+  const sid = document.getElementById('sessionSelect').value;
+  if(!sid) return;
+  convoCtl?.abort(); const ctl = convoCtl = new AbortController();
+  const rows = await beFetch('/history?sid=' + encodeURIComponent(sid), {signal: ctl.signal});
+  if(ctl.signal.aborted) return;
+  const wrap = document.getElementById('conversation');
+  if(!rows){ wrap.innerHTML='<div class="muted">Unable to load conversation</div>'; return; }
+  const frag = document.createDocumentFragment();
+  for(const r of rows) frag.appendChild(conversationRow(r));
+  wrap.replaceChildren(frag);
+  pushEvent('Loaded conversation for ' + sid);
+}
+
+const CONVO_ROW = rowShell(`<div style="margin-bottom:8px"><div class="ts" style="font-size:13px;color:#9aa6b2"></div>
+  <div style="padding:8px;background:rgba(255,255,255,.02);border-radius:6px"><strong class="role"></strong>: <span class="content"></span></div></div>`);
+function conversationRow(r){
+  const d = CONVO_ROW.cloneNode(true);
+  d.querySelector('.ts').textContent = r.created_at;
+  d.querySelector('.role').textContent = r.role;
+  d.querySelector('.content').textContent = r.content;
+  return d;
+}
+
+// KB
+const KB_ROW = rowShell('<div><strong></strong><div></div></div>');
+async function searchKB(){
+  const q = document.getElementById('kbQuery').value.trim(); if(!q) return;
+  kbCtl?.abort(); const ctl = kbCtl = new AbortController();
+  const data = await beFetch('/kb?q=' + encodeURIComponent(q), {signal: ctl.signal});
+  if(ctl.signal.aborted) return;
+  const el = document.getElementById('kbResults');
+  if(!data || data.length===0){ el.innerHTML='<div class="muted">No KB hits</div>'; return; }
+  const frag = document.createDocumentFragment();
+  for(const item of data){
+    const div = KB_ROW.cloneNode(true);
+    div.firstChild.textContent = item.question; div.lastChild.textContent = item.answer;
+    frag.appendChild(div);
+  }
+  el.replaceChildren(frag);
+  pushEvent('KB search: ' + q);
+}
+
+async function addKB(){
+  const q=document.getElementById('kbQ').value.trim();
+  const a=document.getElementById('kbA').value.trim();
+  const tags=document.getElementById('kbTags').value.trim();
+  if(!q||!a){ document.getElementById('kbMsg').innerText='Q&A required'; return; }
+  const res = await beFetch('/admin/kb/add',{method:'POST',body:JSON.stringify({question:q,answer:a,tags:tags}),headers:{'Content-Type':'application/json'}});
+  if(res && res.status==='added'){ document.getElementById('kbMsg').innerText='Added'; pushEvent('KB article added'); } else { document.getElementById('kbMsg').innerText='Failed to add'; }
+}
+
+function renderHealth(h){
+  const el=document.getElementById('health');
+  if(!h){ el.innerText='DOWN'; el.style.background='#600'; return; }
+  el.innerText = h.status==='ok'?'OK':'WARN'; el.style.background = h.status==='ok'?'#072a17':'#604217';
+  pushEvent('Health checked');
+}
+
+// Live updates: with Auto on, the dashboard server relays backend events over SSE. New
+// tickets and messages are applied in place as deltas and never trigger a refetch; the
+// xp-driven panels (leaderboard, users) are polled every POLL_MS, or every LIVE_POLL_MS
+// while the stream is up, so traffic doesn't grow with chat volume
+const POLL_MS = 7000, LIVE_POLL_MS = 30000;
+let stream = null, streamLive = false;
+
+function startStream(){
+  if(!window.EventSource || stream) return;
+  stream = new EventSource('/api/stream');
+  stream.onopen = ()=>{ streamLive = true; pushEvent('Live updates connected'); };
+  stream.onerror = ()=>{
+    streamLive = false;  // EventSource reconnects on its own after a dropped connection...
+    if(stream.readyState === EventSource.CLOSED) stream = null;  // ...but not after a refusal (503)
+  };
+  stream.addEventListener('ticket_created', e=>{
+    const p = JSON.parse(e.data).payload;
+    renderTickets([{id:p.ticket_id, session_id:p.sid, subject:p.subject, status:'open', created_at:p.time},
+                   ...ticketData.filter(t=>t.id !== p.ticket_id)]);  // a refresh may already have it
+    pushEvent('New ticket #' + p.ticket_id);
+  });
+  stream.addEventListener('log_message', e=>{
+    const p = JSON.parse(e.data).payload;
+    if(p.sid === document.getElementById('sessionSelect').value){
+      const wrap = document.getElementById('conversation');
+      wrap.insertBefore(conversationRow({role:p.role, content:p.content, created_at:p.time}), wrap.firstChild);
+    }
+  });
+}
+
+function stopStream(){
+  if(stream){ stream.close(); stream = null; }
+  streamLive = false;
+}
+
+function toggleAuto(){
+  autoRefresh=!autoRefresh; document.getElementById('autoState').innerText=autoRefresh?'ON':'OFF';
+  clearTimeout(autoTimer); autoTimer=null;  // no trailing refresh after switching off
+  if(autoRefresh){ if(!document.hidden) startStream(); autoTick(); } else stopStream();
+}
+// polls only while the tab is visible; a hidden tab stops the timer entirely
+async function autoTick(){
+  if(document.hidden){ autoTimer=null; return; }
+  await refreshAll();
+  if(autoRefresh){ clearTimeout(autoTimer); autoTimer=setTimeout(autoTick, streamLive ? LIVE_POLL_MS : POLL_MS); }
+}
+// a hidden tab drops its stream too, so it does no background work at all; coming back
+// reconnects and refreshes right away to pick up whatever was missed
+document.addEventListener('visibilitychange', ()=>{
+  if(!autoRefresh) return;
+  if(document.hidden){ stopStream(); return; }
+  startStream(); clearTimeout(autoTimer); autoTick();
+});
+
+// Initial load
+refreshAll();